@@ -0,0 +1,722 @@
+"""
+COMET runtime helpers shared by the CLI scripts and the Streamlit app (SAFE FOR STREAMLIT IMPORT)
+
+This module intentionally DOES NOT:
+- import torch / comet / pandas at import time
+- load models
+
+Heavy libraries are imported inside the helpers that need them.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import importlib.util
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+
+def configure_hf_cache() -> str | None:
+    """
+    Point the Hugging Face cache at COMET_HF_CACHE, if set.
+
+    Use a persistent/mounted directory so a container restart does not
+    re-download the checkpoint. An explicit HF_HOME takes precedence.
+    When the optional hf_transfer package is installed, its parallel
+    downloader is switched on too (unless HF_HUB_ENABLE_HF_TRANSFER is set).
+    Must run before huggingface_hub is imported; the COMET helpers below
+    call it first. Returns the cache directory in use, or None for the default.
+    """
+    cache_dir = os.getenv("COMET_HF_CACHE", "").strip()
+    if cache_dir:
+        os.environ.setdefault("HF_HOME", cache_dir)
+    # huggingface_hub refuses the flag when hf_transfer is missing, so only
+    # set it when the package can be imported
+    if importlib.util.find_spec("hf_transfer"):
+        os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
+    hf_home = os.getenv("HF_HOME")
+    if hf_home:
+        os.makedirs(hf_home, exist_ok=True)
+    return hf_home
+
+
+def _resolve_checkpoint(model_name: str) -> tuple[str, bool]:
+    """Return (checkpoint path, whether it was already cached), downloading on a miss."""
+    configure_hf_cache()
+    from comet import download_model  # type: ignore
+
+    try:
+        return download_model(model_name, local_files_only=True), True
+    except KeyError:  # not in the local cache yet
+        return download_model(model_name), False
+    except TypeError:  # COMET release without local_files_only
+        return download_model(model_name), False
+
+
+def download_comet_checkpoint(model_name: str) -> str:
+    """Make sure the COMET checkpoint is in the local cache and return its path (no model load)."""
+    return _resolve_checkpoint(model_name)[0]
+
+
+def load_comet_checkpoint(model_name: str):
+    """
+    Download (if needed) and load a COMET model from the Hugging Face cache.
+
+    When the checkpoint is already in the local cache, both the checkpoint
+    and its encoder/tokenizer are resolved with local_files_only=True, so
+    warm starts make no Hub revision-check requests and work offline.
+    A cache miss, or a COMET release without local_files_only, falls back
+    to the normal calls.
+
+    The model is returned in eval mode with gradients disabled on all
+    parameters, since it is only used for inference.
+    """
+    model_path, cached = _resolve_checkpoint(model_name)
+    from comet import load_from_checkpoint  # type: ignore
+
+    model = None
+    if cached:
+        try:
+            model = load_from_checkpoint(model_path, local_files_only=True)
+        except OSError:  # encoder/tokenizer files missing from the cache
+            pass
+        except TypeError:  # COMET release without local_files_only
+            pass
+    if model is None:
+        model = load_from_checkpoint(model_path)
+
+    model.eval()
+    model.requires_grad_(False)
+    return model
+
+
+def load_in_background(fn, *args, **kwargs) -> Future:
+    """
+    Run fn(*args, **kwargs) in a daemon thread and return a Future for its result.
+
+    Unlike a ThreadPoolExecutor worker, the thread does not hold the process
+    open at exit, so a script that stops early (e.g. nothing to score) does
+    not wait for a model download or load still in progress.
+    """
+    future: Future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as exc:
+            future.set_exception(exc)
+
+    threading.Thread(target=run, name="comet-model-loader", daemon=True).start()
+    return future
+
+
+def quantize_encoder_int8(model):
+    """
+    Replace the Linear layers of the model's XLM-R encoder with dynamic INT8 versions.
+
+    Weights are stored as int8 (about 4x smaller) and activations are
+    quantized on the fly, which speeds up memory-bound CPU inference. The
+    estimator/regression head stays in FP32. Quantized layers run on CPU
+    only, so score the returned model with gpus=0.
+    """
+    import torch
+    from torch.ao.quantization import quantize_dynamic
+
+    model.encoder.model = quantize_dynamic(model.encoder.model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def int8_requested() -> bool:
+    """True when COMET_INT8=1 asks the CLI scripts for the INT8 (CPU) encoder."""
+    return os.getenv("COMET_INT8", "0").strip() == "1"
+
+
+def compile_encoder(model):
+    """
+    Wrap the model's XLM-R encoder in torch.compile (TorchInductor kernel fusion).
+
+    Compiled with dynamic shapes, since every batch pads to a different
+    length. Compilation happens on the first batches and pays off on large
+    files; anything Dynamo cannot trace falls back to eager execution
+    instead of failing. Returns the model unchanged on torch < 2.0.
+    """
+    import torch
+
+    if not hasattr(torch, "compile"):
+        return model
+    import torch._dynamo
+
+    torch._dynamo.config.suppress_errors = True
+    model.encoder.model = torch.compile(model.encoder.model, dynamic=True)
+    return model
+
+
+def compile_requested() -> bool:
+    """True when COMET_COMPILE=1 asks for a torch.compile'd encoder."""
+    return os.getenv("COMET_COMPILE", "0").strip() == "1"
+
+
+def pick_gpus() -> int:
+    """
+    Return the `gpus` value to pass to COMET's model.predict.
+
+    COMET_GPUS=0/1/N overrides detection. Otherwise 1 if CUDA (or Apple MPS)
+    is available, else 0 for CPU. COMET_INT8=1 always means CPU, since the
+    INT8 encoder only runs there.
+    """
+    if int8_requested():
+        return 0
+    override = os.getenv("COMET_GPUS", "").strip()
+    if override:
+        return max(0, int(override))
+
+    import torch
+
+    if torch.cuda.is_available():
+        return 1
+    mps = getattr(torch.backends, "mps", None)
+    if mps is not None and mps.is_available():
+        return 1
+    return 0
+
+
+def pick_batch_size(gpus: int) -> int:
+    """
+    Return a default COMET batch size for the device.
+
+    COMET_BATCH_SIZE overrides. Otherwise 64 on CUDA, 32 on Apple MPS and
+    16 on CPU.
+    """
+    override = os.getenv("COMET_BATCH_SIZE", "").strip()
+    if override:
+        return max(1, int(override))
+
+    if gpus <= 0:
+        return 16
+
+    import torch
+
+    return 64 if torch.cuda.is_available() else 32
+
+
+def configure_torch_threads() -> int:
+    """
+    Pin torch's intra-op thread pool to the CPUs this process may use.
+
+    COMET_CPU_THREADS overrides. Otherwise uses the scheduler affinity mask
+    where available (respects container and taskset CPU limits, unlike
+    os.cpu_count()), further capped at the physical core count when psutil
+    is installed: the encoder's matmuls gain nothing from hyper-threads.
+    The inter-op pool is set to one thread: scoring is a single sequential
+    forward pass per batch, so extra inter-op threads only compete for the
+    same cores. Returns the intra-op thread count.
+    """
+    import torch
+
+    override = os.getenv("COMET_CPU_THREADS", "").strip()
+    if override:
+        threads = int(override)
+    else:
+        try:
+            threads = len(os.sched_getaffinity(0))
+        except AttributeError:  # not available on macOS / Windows
+            threads = os.cpu_count() or 2
+        if importlib.util.find_spec("psutil"):
+            import psutil
+
+            threads = min(threads, psutil.cpu_count(logical=False) or threads)
+    threads = max(1, threads)
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:  # can only be set once, before any inter-op work
+        pass
+    return threads
+
+
+def _enable_fast_cuda_kernels() -> None:
+    """Allow TF32 matmuls/convolutions and cuDNN autotuning on Ampere+ GPUs."""
+    import torch
+
+    if torch.cuda.is_available():
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+        torch.backends.cudnn.benchmark = True
+
+
+def suggest_batch_size(data: list[dict[str, str]], cap: int = 64) -> int | None:
+    """
+    Suggest a batch size from the free RAM and the longest row in `data`.
+
+    Budgets 40% of available memory at roughly 4 KiB per character of the
+    longest src+mt+ref row, clamped to 1..cap. Returns None when psutil
+    is not installed.
+    """
+    if not importlib.util.find_spec("psutil"):
+        return None
+    import psutil
+
+    max_len = max(
+        (sum(len(sample.get(field) or "") for field in ("src", "mt", "ref")) for sample in data),
+        default=1,
+    )
+    available = psutil.virtual_memory().available
+    return max(1, min(cap, int(available * 0.4 / (max(1, max_len) * 4 * 1024))))
+
+
+@contextlib.contextmanager
+def _lowest_available_ram(psutil, interval: float = 0.01):
+    """
+    Track the lowest available system RAM (bytes) while the block runs.
+
+    Yields a one-item list that a background thread keeps at the minimum of
+    psutil.virtual_memory().available, sampled every `interval` seconds, so
+    the peak of the block is seen rather than the state after it. With
+    psutil=None nothing is sampled and the list holds infinity.
+    """
+    lowest = [float("inf")]
+    if psutil is None:
+        yield lowest
+        return
+    done = threading.Event()
+
+    def sample():
+        while True:
+            lowest[0] = min(lowest[0], psutil.virtual_memory().available)
+            if done.wait(interval):
+                return
+
+    sampler = threading.Thread(target=sample, name="ram-sampler", daemon=True)
+    sampler.start()
+    try:
+        yield lowest
+    finally:
+        done.set()
+        sampler.join()
+
+
+def autotune_batch_size(
+    model,
+    sample_data: list[dict[str, str]],
+    candidates=(8, 16, 32, 64),
+    gpus: int = 0,
+    bf16: bool = False,
+    score_cache: dict | None = None,
+) -> int:
+    """
+    Probe `candidates` on a slice of `sample_data` and return the fastest batch size.
+
+    Each candidate (largest first) scores the same probe rows (as many as
+    the largest candidate that fits in the sample) and is timed, so only
+    the batch size differs between runs. A candidate that runs out of
+    memory, or at any point while it runs leaves less than 20% of system
+    RAM available (sampled every 10 ms when psutil is installed), is dropped. Falls back to the smallest candidate if none
+    succeed.
+
+    score_cache, if given (the one passed to predict_scores), receives the
+    scores of the probe rows, so scoring does not compute them again.
+    """
+    import torch
+
+    psutil = None
+    if importlib.util.find_spec("psutil"):
+        import psutil
+
+    candidates = sorted({int(c) for c in candidates if int(c) >= 1}, reverse=True)
+    # A candidate larger than the sample would not be timed on a full batch
+    probe = [c for c in candidates if c <= len(sample_data)]
+    if not probe:  # too few rows to compare: any candidate scores them in one batch
+        return min(candidates, default=1)
+
+    def run(rows, size):
+        with torch.inference_mode(), _autocast(gpus, bf16):
+            return model.predict(rows, batch_size=size, gpus=gpus, progress_bar=False, length_batching=False)
+
+    low_ram = None
+    if psutil is not None:
+        low_ram = psutil.virtual_memory().total * 0.2
+
+    # One tiny call first so one-off start-up costs don't count against the first candidate
+    run(sample_data[:1], 1)
+
+    rows = sample_data[: probe[0]]
+    best_size, best_rate = None, 0.0
+    for size in probe:
+        try:
+            with _lowest_available_ram(psutil) as lowest:
+                start = time.perf_counter()
+                model_output = run(rows, size)
+                elapsed = time.perf_counter() - start
+        except (MemoryError, torch.cuda.OutOfMemoryError):
+            if gpus > 0 and torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            continue
+        if score_cache is not None:
+            score_cache.update(
+                {
+                    segment_digest(row.get("src"), row.get("mt"), row.get("ref")): score
+                    for row, score in zip(rows, model_output["scores"])
+                }
+            )
+            score_cache = None  # every candidate scores the same rows
+        if low_ram is not None and lowest[0] < low_ram:
+            print(f"Batch size {size}: less than 20% of RAM left at peak, skipped")
+            continue
+        rate = len(rows) / max(elapsed, 1e-9)
+        print(f"Batch size {size}: {rate:.1f} rows/s")
+        if rate > best_rate:
+            best_size, best_rate = size, rate
+    return best_size if best_size is not None else probe[-1]
+
+
+def _fp16_on_cuda(gpus: int) -> bool:
+    """True when scoring runs on CUDA in FP16 (the default; COMET_AUTOCAST=0 disables it)."""
+    import torch
+
+    return gpus > 0 and torch.cuda.is_available() and os.getenv("COMET_AUTOCAST", "1") != "0"
+
+
+def _autocast(gpus: int, bf16: bool = False):
+    """
+    Return the mixed-precision context for scoring.
+
+    FP16 autocast on CUDA (roughly 2x encoder throughput, half the activation
+    memory); FP16 rather than BF16 keeps enough mantissa for 4-decimal scores.
+    COMET_AUTOCAST=0 disables it. CPU runs stay in FP32 unless bf16=True,
+    which halves activation bytes on CPUs with native BF16 support.
+    """
+    import torch
+
+    if _fp16_on_cuda(gpus):
+        return torch.autocast(device_type="cuda", dtype=torch.float16)
+    if gpus <= 0 and bf16:
+        return torch.autocast(device_type="cpu", dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def segment_digest(src: str | None, mt: str | None, ref: str | None) -> bytes:
+    """
+    16-byte key for a (src, mt, ref) triple, used by score caches.
+
+    Caches keyed on the digest hold 16 bytes per segment instead of keeping
+    all three strings alive.
+    """
+    text = "\x1f".join(field or "" for field in (src, mt, ref))
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class SqliteScoreCache:
+    """
+    Score cache for predict_scores(score_cache=...) kept in a SQLite file.
+
+    Maps segment_digest(src, mt, ref) to a score, like the in-memory dict
+    cache, but survives restarts when the file is on a persistent volume.
+    `namespace` (model name plus precision settings) keeps scores from
+    different models apart in one file. Safe to share between threads.
+    """
+
+    def __init__(self, path, namespace: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        # WAL lets several processes read while one writes
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS scores "
+            "(ns TEXT NOT NULL, k BLOB NOT NULL, v REAL NOT NULL, PRIMARY KEY (ns, k)) WITHOUT ROWID"
+        )
+        self._db.commit()
+
+    def get(self, key: bytes, default=None):
+        with self._lock:
+            row = self._db.execute("SELECT v FROM scores WHERE ns = ? AND k = ?", (self.namespace, key)).fetchone()
+        return default if row is None else row[0]
+
+    def update(self, scores: dict) -> None:
+        """Store many scores in one transaction."""
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO scores (ns, k, v) VALUES (?, ?, ?)",
+                [(self.namespace, key, float(value)) for key, value in scores.items()],
+            )
+
+
+def open_score_cache(
+    model_name: str, int8: bool = False, bf16: bool = False, gpus: int | None = None
+) -> SqliteScoreCache | None:
+    """
+    SqliteScoreCache in the COMET_SCORE_DB file for this model and precision
+    setting, or None when COMET_SCORE_DB is unset.
+
+    `gpus` is the value scoring will use (default: pick_gpus()); FP16 scores
+    from CUDA runs are kept apart from FP32 ones.
+    """
+    path = os.getenv("COMET_SCORE_DB", "").strip()
+    if not path:
+        return None
+    fp16 = _fp16_on_cuda(pick_gpus() if gpus is None else gpus)
+    return SqliteScoreCache(path, f"{model_name}|int8={int(int8)}|bf16={int(bf16)}|fp16={int(fp16)}")
+
+
+def _padded_length(sample: dict[str, str]) -> int:
+    """Longest of src/mt/ref in whitespace tokens (the length a batch gets padded to)."""
+    return max(len((sample.get(field) or "").split()) for field in ("src", "mt", "ref"))
+
+
+def _token_budget_runs(lengths: list[int], batch_size: int, max_tokens: int) -> tuple[list[int], list[int]]:
+    """
+    Per-row batch sizes for length-sorted rows under a token budget.
+
+    Each row gets the largest batch size whose batch (rows x that row's
+    padded length) fits in max_tokens, capped at batch_size and rounded
+    down to a power of two so that only a few distinct sizes occur. Returns
+    (sizes, run_end): run_end[i] is the end of the run of rows sharing
+    row i's size, so each run can go to model.predict in one call.
+    """
+    sizes = []
+    for length in lengths:
+        fit = max(1, min(batch_size, max_tokens // max(1, length)))
+        sizes.append(fit if fit == batch_size else 1 << (fit.bit_length() - 1))
+    run_end = [len(sizes)] * len(sizes)
+    for i in range(len(sizes) - 2, -1, -1):
+        run_end[i] = run_end[i + 1] if sizes[i] == sizes[i + 1] else i + 1
+    return sizes, run_end
+
+
+def predict_scores(
+    model,
+    data: list[dict[str, str]],
+    batch_size: int | None = None,
+    gpus: int | None = None,
+    bf16: bool = False,
+    dedupe: bool = True,
+    chunk_size: int | None = None,
+    progress=None,
+    score_cache: dict | None = None,
+    max_batch_tokens: int | None = None,
+) -> list[float | None]:
+    """
+    Score `data` (COMET input dicts) and return one score per row.
+
+    Rows whose src or mt is empty/whitespace-only are not sent to the model
+    and get a score of None.
+
+    Device and batch size default to pick_gpus() / pick_batch_size().
+    Identical (src, mt, ref) rows are scored once and the score is copied
+    back to every duplicate (dedupe=False scores every row); rows are sent
+    to the model sorted by length to minimise padding, and scores are
+    returned in input order.
+
+    With chunk_size, rows go to model.predict in chunks of that many and
+    progress(done, total) is called after each chunk (for UI progress bars).
+
+    max_batch_tokens (default: COMET_BATCH_TOKENS, unset = off) caps each
+    batch at about that many padded whitespace tokens: batches of long rows
+    shrink below batch_size, which stays the upper bound for short rows.
+
+    score_cache, if given, maps segment_digest(src, mt, ref) to a score from
+    earlier runs of the same model and settings (a dict, or anything with
+    get() and update() such as SqliteScoreCache): cached rows skip the
+    model, and newly computed scores are added to it in one update().
+
+    Scoring runs under torch.inference_mode(); GPU runs also use FP16
+    autocast plus TF32 kernels, and bf16=True enables
+    BF16 autocast for CPU runs. On CUDA out-of-memory the batch size is
+    halved and the chunk retried.
+    """
+    import torch
+
+    # Score each distinct row once; `positions` maps every row to its unique
+    # index (None for blank rows, which are skipped)
+    unique_index: dict[tuple, int] = {}
+    unique_data = []
+    unique_keys = []
+    positions = []
+    for sample in data:
+        if not (sample.get("src") or "").strip() or not (sample.get("mt") or "").strip():
+            positions.append(None)
+            continue
+        key = (sample.get("src"), sample.get("mt"), sample.get("ref"))
+        idx = unique_index.get(key) if dedupe else None
+        if idx is None:
+            idx = unique_index[key] = len(unique_data)
+            unique_data.append(sample)
+            unique_keys.append(key)
+        positions.append(idx)
+
+    # Scores already known from earlier runs; only the rest go to the model
+    unique_scores: list = [None] * len(unique_data)
+    pending = list(range(len(unique_data)))
+    if score_cache is not None:
+        unique_keys = [segment_digest(*key) for key in unique_keys]
+        for i, key in enumerate(unique_keys):
+            unique_scores[i] = score_cache.get(key)
+        pending = [i for i in pending if unique_scores[i] is None]
+    if not pending:  # nothing to score (COMET fails on empty input)
+        return [None if idx is None else unique_scores[idx] for idx in positions]
+
+    # Feed rows shortest-first so each batch pads to a similar length, then
+    # undo the permutation. COMET's own length_batching is turned off because
+    # it would re-sort by source length only.
+    order = sorted(pending, key=lambda i: _padded_length(unique_data[i]))
+    sorted_data = [unique_data[i] for i in order]
+
+    if gpus is None:
+        gpus = pick_gpus()
+    if batch_size is None:
+        batch_size = pick_batch_size(gpus)
+    if max_batch_tokens is None:
+        override = os.getenv("COMET_BATCH_TOKENS", "").strip()
+        max_batch_tokens = int(override) if override else None
+    if gpus > 0:
+        _enable_fast_cuda_kernels()
+
+    total = len(sorted_data)
+    chunk_size = max(1, chunk_size) if chunk_size else total
+    run_sizes = run_end = None
+    if max_batch_tokens:
+        run_sizes, run_end = _token_budget_runs(
+            [_padded_length(sample) for sample in sorted_data], batch_size, max_batch_tokens
+        )
+    sorted_scores: list[float] = []
+    while len(sorted_scores) < total:
+        done = len(sorted_scores)
+        end = done + chunk_size
+        chunk_batch_size = batch_size
+        if run_sizes is not None:
+            # A chunk never spans two budgeted batch sizes
+            end = min(end, run_end[done])
+            chunk_batch_size = min(batch_size, run_sizes[done])
+        chunk = sorted_data[done:end]
+        try:
+            with torch.inference_mode(), _autocast(gpus, bf16):
+                model_output = model.predict(
+                    chunk, batch_size=chunk_batch_size, gpus=gpus, progress_bar=progress is None, length_batching=False
+                )
+        except torch.cuda.OutOfMemoryError:
+            if chunk_batch_size <= 1:
+                raise
+            torch.cuda.empty_cache()
+            batch_size = max(1, chunk_batch_size // 2)
+            print(f"CUDA out of memory - retrying with batch_size={batch_size}")
+            continue
+        sorted_scores.extend(model_output["scores"])
+        if progress is not None:
+            progress(len(sorted_scores), total)
+
+    for sorted_pos, idx in enumerate(order):
+        unique_scores[idx] = sorted_scores[sorted_pos]
+    if score_cache is not None:
+        score_cache.update({unique_keys[idx]: unique_scores[idx] for idx in order})
+    return [None if idx is None else unique_scores[idx] for idx in positions]
+
+
+def score_stats(scores) -> dict:
+    """
+    Summary statistics for a score list (None entries = skipped rows).
+
+    Returns a dict with total_units, skipped, and avg_score / min_score /
+    max_score (None when nothing was scored), computed with numpy reductions.
+    """
+    import numpy as np
+
+    scored = np.fromiter((s for s in scores if s is not None), dtype=np.float32)
+    stats = {
+        "total_units": len(scores),
+        "skipped": len(scores) - scored.size,
+        "avg_score": None,
+        "min_score": None,
+        "max_score": None,
+    }
+    if scored.size:
+        stats["avg_score"] = float(scored.mean(dtype=np.float64))
+        stats["min_score"] = float(scored.min())
+        stats["max_score"] = float(scored.max())
+    return stats
+
+
+def _normalise_cell(value):
+    """Map calamine cell values to what pandas/openpyxl would give: blank -> None, 3.0 -> 3."""
+    if value == "":
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def read_sheet(path) -> tuple[list[str], list[list]]:
+    """
+    Read the first sheet of an Excel file as (header, rows) of plain Python values.
+
+    Uses the Rust-based python-calamine reader when installed (much faster
+    than openpyxl), otherwise openpyxl in read-only mode. Blank cells are None.
+    """
+    if importlib.util.find_spec("python_calamine"):
+        from python_calamine import CalamineWorkbook
+
+        values = CalamineWorkbook.from_path(str(path)).get_sheet_by_index(0).to_python()
+        values = [[_normalise_cell(v) for v in row] for row in values]
+    else:
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            values = [list(row) for row in workbook.worksheets[0].iter_rows(values_only=True)]
+        finally:
+            workbook.close()
+
+    if not values:
+        return [], []
+    header = ["" if h is None else str(h) for h in values[0]]
+    return header, values[1:]
+
+
+def write_xlsx(path, header: list[str], rows, sheet_name: str = "Sheet1") -> None:
+    """
+    Write a header row plus `rows` (iterable of sequences) to an .xlsx file.
+
+    `path` may also be a binary file-like object such as BytesIO. Uses
+    xlsxwriter in constant_memory mode when installed, otherwise openpyxl
+    in write-only mode; either way rows are streamed out as they are
+    written instead of being held in memory as a cell tree.
+
+    Strings are always written as plain text: segment text starting with
+    "=" does not become a formula and URLs do not become hyperlinks.
+    """
+    target = path if hasattr(path, "write") else str(path)
+    if importlib.util.find_spec("xlsxwriter"):
+        import xlsxwriter
+
+        workbook = xlsxwriter.Workbook(
+            target, {"constant_memory": True, "strings_to_formulas": False, "strings_to_urls": False}
+        )
+        try:
+            worksheet = workbook.add_worksheet(sheet_name)
+            worksheet.write_row(0, 0, header)
+            for row_idx, row in enumerate(rows, start=1):
+                worksheet.write_row(row_idx, 0, row)
+        finally:
+            workbook.close()
+    else:
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+
+        def as_text(value):
+            # openpyxl writes any str starting with "=" as a formula
+            cell = WriteOnlyCell(worksheet, value)
+            cell.data_type = "s"
+            return cell
+
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet(sheet_name)
+        worksheet.append(header)
+        for row in rows:
+            worksheet.append([as_text(v) if isinstance(v, str) and v.startswith("=") else v for v in row])
+        workbook.save(target)
@@ -1,125 +1,182 @@
 """
-memoQ XLIFF (.mqxliff/.xlf/.xliff) parser helpers (SAFE FOR STREAMLIT IMPORT)
+COMET MT Evaluation Script for memoQ XLIFF Files
 
-This module intentionally DOES NOT:
-- import torch / comet
-- load models
-- call input()
-- do CLI main()
+This script extracts confirmed segments from a memoQ XLIFF file (.mqxliff,
+.xliff or .xlf), scores the MT output against the confirmed translation with
+COMET-DA and saves the results to an Excel file next to the input.
 
-It only parses XLIFF and returns extracted rows.
+Usage:
+    python mqxliff_comet_to_xlsx.py path/to/file.mqxliff
+
+If no path is given, the script asks for one.
+
+Parsing lives in mqxliff_parser.py (shared with the Streamlit app), so this
+file only holds the CLI: model loading, scoring and export.
 """
 
 from __future__ import annotations
 
-import xml.etree.ElementTree as ET
+import functools
+import sys
 from pathlib import Path
-from typing import Any
 
+from comet_utils import (
+    compile_encoder,
+    compile_requested,
+    configure_torch_threads,
+    int8_requested,
+    load_comet_checkpoint,
+    load_in_background,
+    open_score_cache,
+    predict_scores,
+    quantize_encoder_int8,
+    score_stats,
+    write_xlsx,
+)
+from mqxliff_parser import parse_mqxliff  # re-exported for existing importers
+
+# COMET model to use for evaluation
+# wmt22-comet-da is a reference-based model (same as run_comet_evaluation.py)
+COMET_MODEL_NAME = "Unbabel/wmt22-comet-da"
+
+# Columns written to the output file, in order
+OUTPUT_COLUMNS = ["trans_unit_id", "segmentguid", "mt_provider", "source", "mt", "ref"]
+
+
+@functools.lru_cache(maxsize=1)
+def load_comet_model(model_name=COMET_MODEL_NAME):
+    """
+    Download and load the COMET model.
 
-def _ns_uri(tag: str) -> str | None:
-    """Return namespace URI from a tag like '{uri}name', else None."""
-    if tag.startswith("{") and "}" in tag:
-        return tag[1 : tag.index("}")]
-    return None
+    The model is downloaded on first use and cached for subsequent runs.
+    COMET (and torch) are only imported here, so importing this module
+    for parse_mqxliff stays cheap.
 
+    Args:
+        model_name: Hugging Face model id (defaults to COMET_MODEL_NAME)
 
-def _local_name(tag: str) -> str:
-    """Return local name from '{uri}name' or 'name'."""
-    return tag.split("}", 1)[-1] if "}" in tag else tag
+    Returns:
+        Loaded COMET model ready for prediction
+    """
+    print(f"Loading COMET model: {model_name}")
+    print("Note: Model will be downloaded on first run (this may take a few minutes)...")
 
+    # Download the model checkpoint (cached after first download) and load it.
+    # Once cached, no Hugging Face Hub requests are made (works offline too)
+    model = load_comet_checkpoint(model_name)
 
-def _text(elem: ET.Element | None) -> str:
-    """Get full text including nested inline tags."""
-    if elem is None:
-        return ""
-    return "".join(elem.itertext()).strip()
+    # COMET_INT8=1: quantize the encoder to INT8 (faster CPU scoring,
+    # scores shift slightly; scoring then runs on CPU)
+    if int8_requested():
+        model = quantize_encoder_int8(model)
+        print("Encoder quantized to INT8 (COMET_INT8=1)")
 
+    # COMET_COMPILE=1: compile the encoder with torch.compile (slower first
+    # batches, faster after that on large files)
+    if compile_requested():
+        model = compile_encoder(model)
+        print("Encoder compiled with torch.compile (COMET_COMPILE=1)")
 
-def parse_mqxliff(xliff_path: Path):
-    """
-    Parse memoQ XLIFF and extract only segments with mq:status="ManuallyConfirmed".
+    # Use one torch thread per CPU available to this process (container-aware)
+    threads = configure_torch_threads()
+    print(f"Using {threads} CPU thread(s) for torch")
 
-    Returns:
-      extracted_data: list[dict] with keys:
-        - trans_unit_id
-        - segmentguid
-        - mt_provider
-        - source
-        - mt
-        - ref
-      source_lang: str | None
-      target_lang: str | None
+    print("Model loaded successfully!")
+
+    return model
+
+
+def score_and_export(model, extracted_data, source_lang, target_lang, output_file_path):
+    """
+    Score the extracted segments with COMET and save them as an Excel file.
+
+    Args:
+        model: Loaded COMET model
+        extracted_data: Rows returned by parse_mqxliff
+        source_lang: Source language code from the XLIFF (or None)
+        target_lang: Target language code from the XLIFF (or None)
+        output_file_path: Path where output Excel file will be saved
+    """
+    # COMET expects a list of dictionaries with 'src', 'mt', and 'ref' keys
+    data = [{"src": r["source"], "mt": r["mt"], "ref": r["ref"]} for r in extracted_data]
+
+    # predict_scores() picks the device (GPU when available) and a batch size
+    # that suits it; set COMET_GPUS / COMET_BATCH_SIZE to override either.
+    # With COMET_SCORE_DB set, segments scored in earlier runs are reused.
+    print(f"\nComputing COMET scores for {len(data)} segments...")
+    scores = predict_scores(model, data, score_cache=open_score_cache(COMET_MODEL_NAME, int8=int8_requested()))
+
+    # Language codes are the same for every row, so they are added as
+    # constant columns next to the extracted fields
+    header = list(OUTPUT_COLUMNS)
+    lang_values = []
+    if source_lang:
+        header.append("source_language")
+        lang_values.append(source_lang)
+    if target_lang:
+        header.append("target_language")
+        lang_values.append(target_lang)
+    header.append("comet_score")
+
+    write_xlsx(
+        output_file_path,
+        header,
+        ([r[col] for col in OUTPUT_COLUMNS] + lang_values + [score] for r, score in zip(extracted_data, scores)),
+    )
+
+    # Display summary statistics
+    print(f"\nSaved: {output_file_path}")
+    stats = score_stats(scores)
+    print(f"  - Score range: {stats['min_score']:.4f} - {stats['max_score']:.4f}")
+    print(f"  - Average score: {stats['avg_score']:.4f}")
+
+
+def main():
+    """
+    Main function: parse the XLIFF given on the command line, score it and save the results.
     """
-    xliff_path = Path(xliff_path)
-
-    tree = ET.parse(xliff_path)
-    root = tree.getroot()
-
-    # Default XLIFF namespace (commonly: urn:oasis:names:tc:xliff:document:1.2)
-    xliff_ns = _ns_uri(root.tag)
-
-    # memoQ namespace usually fixed: xmlns:mq="MQXliff"
-    mq_ns = "MQXliff"
-
-    ns: dict[str, str] = {}
-    if xliff_ns:
-        ns["x"] = xliff_ns
-    ns["mq"] = mq_ns
-
-    # Language codes from <file>
-    source_lang = None
-    target_lang = None
-    file_elem = root.find(".//x:file", ns) if xliff_ns else root.find(".//file")
-    if file_elem is not None:
-        source_lang = file_elem.get("source-language") or file_elem.get("source_language")
-        target_lang = file_elem.get("target-language") or file_elem.get("target_language")
-
-    # Collect trans-units
-    trans_units = root.findall(".//x:trans-unit", ns) if xliff_ns else [
-        e for e in root.iter() if _local_name(e.tag) == "trans-unit"
-    ]
-
-    extracted_data: list[dict[str, Any]] = []
-    for tu in trans_units:
-        status = tu.get(f"{{{mq_ns}}}status")
-        if status != "ManuallyConfirmed":
-            continue
-
-        tu_id = tu.get("id", "")
-        seg_guid = tu.get(f"{{{mq_ns}}}segmentguid", "")
-
-        # source/ref from trans-unit
-        src_elem = tu.find("x:source", ns) if xliff_ns else tu.find("source")
-        ref_elem = tu.find("x:target", ns) if xliff_ns else tu.find("target")
-        source_text = _text(src_elem)
-        ref_text = _text(ref_elem)
-
-        # MT from mq:insertedmatch
-        mt_text = ""
-        mt_provider = ""
-
-        for m in tu.findall("mq:insertedmatch", ns):
-            matchtype = m.get("matchtype")
-            matchsrc = (m.get("source") or "").strip()
-
-            # robust: "MT / ..." (case-insensitive)
-            if matchtype == "1" and matchsrc.lower().startswith("mt /"):
-                mt_provider = matchsrc
-                mt_target = m.find("x:target", ns) if xliff_ns else m.find("target")
-                mt_text = _text(mt_target)
-                break
-
-        if source_text and ref_text and mt_text:
-            extracted_data.append(
-                {
-                    "trans_unit_id": tu_id,
-                    "segmentguid": seg_guid,
-                    "mt_provider": mt_provider,
-                    "source": source_text,
-                    "mt": mt_text,
-                    "ref": ref_text,
-                }
-            )
-
-    return extracted_data, source_lang, target_lang
+    print("=" * 60)
+    print("COMET MT Evaluation (memoQ XLIFF)")
+    print("=" * 60)
+
+    # Take the file path from the command line, or ask for it
+    if len(sys.argv) > 1:
+        raw_path = sys.argv[1]
+    else:
+        raw_path = input("Path to .mqxliff/.xliff file: ")
+    xliff_path = Path(raw_path.strip().strip('"'))
+
+    if not xliff_path.exists():
+        print(f"\nError: File not found: {xliff_path}")
+        sys.exit(1)
+
+    # Start loading the COMET model (downloads if needed) in the background
+    # while the XLIFF is parsed; the two are independent, so the shorter one
+    # is hidden behind the longer one. The loader thread does not keep the
+    # process alive, so an early exit below does not wait for the load.
+    model_future = load_in_background(load_comet_model)
+
+    # Extract confirmed segments (source, MT, reference)
+    print(f"\nParsing: {xliff_path}")
+    extracted_data, source_lang, target_lang = parse_mqxliff(xliff_path)
+    print(f"  - Found {len(extracted_data)} confirmed segments with MT")
+    print(f"  - Language pair: {source_lang} -> {target_lang}")
+
+    if not extracted_data:
+        print("\nNo valid translation units found. Nothing to score.")
+        sys.exit(1)
+
+    model = model_future.result()
+
+    # Save next to the input, e.g. file.mqxliff -> file_comet_scores.xlsx
+    output_path = xliff_path.with_name(f"{xliff_path.stem}_comet_scores.xlsx")
+    score_and_export(model, extracted_data, source_lang, target_lang, output_path)
+
+    print("\n" + "=" * 60)
+    print("Evaluation complete!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    # Run the main function when script is executed
+    main()
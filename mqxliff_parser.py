@@ -0,0 +1,167 @@
+"""
+memoQ XLIFF (.mqxliff/.xlf/.xliff) parser helpers (SAFE FOR STREAMLIT IMPORT)
+
+This module intentionally DOES NOT:
+- import torch / comet
+- load models
+- call input()
+- do CLI main()
+
+It only parses XLIFF and returns extracted rows.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import IO, Any, Union
+
+from lxml import etree
+
+# memoQ namespace usually fixed: xmlns:mq="MQXliff"
+MQ_NS = "MQXliff"
+
+# Namespaced attribute names, built once rather than per trans-unit
+_MQ_STATUS = f"{{{MQ_NS}}}status"
+_MQ_SEGMENTGUID = f"{{{MQ_NS}}}segmentguid"
+
+
+def _ns_uri(tag: str) -> str | None:
+    """Return namespace URI from a tag like '{uri}name', else None."""
+    if tag.startswith("{") and "}" in tag:
+        return tag[1 : tag.index("}")]
+    return None
+
+
+def _local_name(tag: str) -> str:
+    """Return local name from '{uri}name' or 'name'."""
+    return tag.split("}", 1)[-1] if "}" in tag else tag
+
+
+def _qname(ns: str | None, local: str) -> str:
+    """Return '{uri}local' for a namespace URI, or the bare local name."""
+    return f"{{{ns}}}{local}" if ns else local
+
+
+# XPath string value: concatenated descendant text, evaluated in libxml2.
+# (text_content() only exists on lxml.html elements.)
+_string_value = etree.XPath("string()", smart_strings=False)
+
+# Exact-match MT candidates: <mq:insertedmatch matchtype="1">
+_mt_matches = etree.XPath("mq:insertedmatch[@matchtype='1']", namespaces={"mq": MQ_NS})
+
+
+# A filesystem path, or a binary file-like object (e.g. an upload buffer)
+XliffSource = Union[str, Path, IO[bytes]]
+
+
+def _text(elem: etree._Element | None) -> str:
+    """Get full text including nested inline tags."""
+    if elem is None:
+        return ""
+    return _string_value(elem).strip()
+
+
+def parse_mqxliff(xliff_path: XliffSource):
+    """
+    Parse memoQ XLIFF and extract only segments with mq:status="ManuallyConfirmed".
+
+    xliff_path may be a path or a binary file-like object, which is read
+    from its current position (no temp file needed for in-memory uploads).
+
+    Returns:
+      extracted_data: list[dict] with keys:
+        - trans_unit_id
+        - segmentguid
+        - mt_provider
+        - source
+        - mt
+        - ref
+      source_lang: str | None
+      target_lang: str | None
+    """
+    # lxml reads file-like objects directly; paths are passed as str
+    source = xliff_path if hasattr(xliff_path, "read") else str(xliff_path)
+
+    source_lang = None
+    target_lang = None
+    extracted_data: list[dict[str, Any]] = []
+
+    # Stream the document: only <file> (for language codes) and <trans-unit>
+    # events are reported, and each unit is dropped once processed so the
+    # full tree is never held in memory. "{*}" matches the default XLIFF
+    # namespace (commonly: urn:oasis:names:tc:xliff:document:1.2) or none.
+    context = etree.iterparse(
+        source,
+        events=("start", "end"),
+        tag=("{*}file", "{*}trans-unit"),
+        resolve_entities=False,
+    )
+    # <source>/<target> tag names for the XLIFF namespace in use; only
+    # rebuilt if a unit arrives with a different namespace than the last one
+    unit_tag = None
+    source_tag, target_tag = "source", "target"
+    for event, elem in context:
+        if _local_name(elem.tag) == "file":
+            # Language codes from the first <file>
+            if event == "start" and source_lang is None and target_lang is None:
+                source_lang = elem.get("source-language") or elem.get("source_language")
+                target_lang = elem.get("target-language") or elem.get("target_language")
+            continue
+
+        if event != "end":
+            continue
+
+        tu = elem
+        if tu.tag != unit_tag:
+            unit_tag = tu.tag
+            xliff_ns = _ns_uri(unit_tag)
+            source_tag = _qname(xliff_ns, "source")
+            target_tag = _qname(xliff_ns, "target")
+
+        status = tu.get(_MQ_STATUS)
+        if status == "ManuallyConfirmed":
+            row = _extract_unit(tu, source_tag, target_tag)
+            if row is not None:
+                extracted_data.append(row)
+
+        # Free the processed unit and any already-seen siblings
+        tu.clear(keep_tail=True)
+        while tu.getprevious() is not None:
+            del tu.getparent()[0]
+
+    return extracted_data, source_lang, target_lang
+
+
+def _extract_unit(tu: etree._Element, source_tag: str, target_tag: str) -> dict[str, Any] | None:
+    """Extract one row from a confirmed trans-unit, or None if incomplete."""
+    tu_id = tu.get("id", "")
+    seg_guid = tu.get(_MQ_SEGMENTGUID, "")
+
+    # source/ref from trans-unit
+    source_text = _text(tu.find(source_tag))
+    ref_text = _text(tu.find(target_tag))
+
+    # MT from mq:insertedmatch
+    mt_text = ""
+    mt_provider = ""
+
+    for m in _mt_matches(tu):
+        matchsrc = (m.get("source") or "").strip()
+
+        # robust: "MT / ..." (case-insensitive)
+        if matchsrc.lower().startswith("mt /"):
+            mt_provider = matchsrc
+            mt_text = _text(m.find(target_tag))
+            break
+
+    if not (source_text and ref_text and mt_text):
+        return None
+
+    return {
+        "trans_unit_id": tu_id,
+        "segmentguid": seg_guid,
+        "mt_provider": mt_provider,
+        "source": source_text,
+        "mt": mt_text,
+        "ref": ref_text,
+    }
@@ -9,10 +9,23 @@ COMET (Crosslingual Optimized Metric for Evaluation of Translation) is a neural
 that evaluates translation quality by comparing MT output against a reference translation.
 """
 
-import pandas as pd
-# Import COMET from unbabel-comet package (installed as 'unbabel-comet' but imported as 'comet')
+# COMET (unbabel-comet package, imported as 'comet') is loaded via comet_utils
 # Note: If IDE shows import error, ensure it's using the .venv Python interpreter
-from comet import download_model, load_from_checkpoint  # type: ignore
+from comet_utils import (
+    compile_encoder,
+    compile_requested,
+    configure_torch_threads,
+    int8_requested,
+    load_comet_checkpoint,
+    load_in_background,
+    open_score_cache,
+    predict_scores,
+    quantize_encoder_int8,
+    read_sheet,
+    score_stats,
+    write_xlsx,
+)
+import functools
 import os
 from pathlib import Path
 
@@ -36,7 +49,8 @@ EXCEL_FILES = [
 ]
 
 
-def load_comet_model():
+@functools.lru_cache(maxsize=1)
+def load_comet_model(model_name=COMET_MODEL_NAME):
     """
     
     Download and load the COMET model.
@@ -45,53 +59,80 @@ def load_comet_model():
     This function handles the model initialization which is needed before
     computing any scores.
     
+    The loaded model is memoised per process, so repeated calls (e.g. from
+    a batch driver or another tool importing this module) return the same
+    instance instantly instead of reloading it.
+    
+    Args:
+        model_name: Hugging Face model id (defaults to COMET_MODEL_NAME)
+    
     Returns:
         Loaded COMET model ready for prediction
     """
-    print(f"Loading COMET model: {COMET_MODEL_NAME}")
+    print(f"Loading COMET model: {model_name}")
     print("Note: Model will be downloaded on first run (this may take a few minutes)...")
     
-    # Download the model checkpoint (cached after first download)
-    model_path = download_model(COMET_MODEL_NAME)
+    # Download the model checkpoint (cached after first download) and load it.
+    # Once cached, no Hugging Face Hub requests are made (works offline too)
+    model = load_comet_checkpoint(model_name)
+    
+    # COMET_INT8=1: quantize the encoder to INT8 (faster CPU scoring,
+    # scores shift slightly; scoring then runs on CPU)
+    if int8_requested():
+        model = quantize_encoder_int8(model)
+        print("Encoder quantized to INT8 (COMET_INT8=1)")
+
+    # COMET_COMPILE=1: compile the encoder with torch.compile (slower first
+    # batches, faster after that on large files)
+    if compile_requested():
+        model = compile_encoder(model)
+        print("Encoder compiled with torch.compile (COMET_COMPILE=1)")
     
-    # Load the model from the checkpoint
-    model = load_from_checkpoint(model_path)
+    # Use one torch thread per CPU available to this process (container-aware)
+    threads = configure_torch_threads()
+    print(f"Using {threads} CPU thread(s) for torch")
     
     print("Model loaded successfully!")
     
     return model
 
 
-def process_excel_file(model, input_file_path, output_file_path):
+def _cell_text(row, idx):
+    """Return a cell as COMET input text (blank or missing cells become '')."""
+    value = row[idx] if idx < len(row) else None
+    return "" if value is None else str(value)
+
+
+def prepare_excel_file(input_file_path):
     """
-    Process a single Excel file: read data, compute COMET scores, and save results.
+    Read a single Excel file and prepare its rows for COMET.
     
     This function:
     1. Reads the Excel file with source, mt, and ref columns
-    2. Prepares data in the format expected by COMET
-    3. Computes scores for all rows
-    4. Adds scores as a new column
-    5. Saves the result to a new Excel file
+    2. Verifies the required columns exist
+    3. Prepares data in the format expected by COMET
     
     Args:
-        model: Loaded COMET model
         input_file_path: Path to input Excel file
-        output_file_path: Path where output Excel file will be saved
+    
+    Returns:
+        (header, rows, data): the sheet's header row, its data rows and their COMET input rows
     """
-    print(f"\nProcessing: {input_file_path}")
+    print(f"\nReading: {input_file_path}")
     
-    # Read the Excel file into a pandas DataFrame
-    # This handles the Excel file format and loads all columns
-    df = pd.read_excel(input_file_path)
+    # Read the Excel file into a header row plus plain Python rows
+    # This loads all columns without going through pandas
+    # (uses the fast calamine reader when python-calamine is installed)
+    header, rows = read_sheet(input_file_path)
     
     # Display basic info about the file
-    print(f"  - Found {len(df)} rows")
-    print(f"  - Columns: {list(df.columns)}")
+    print(f"  - Found {len(rows)} rows")
+    print(f"  - Columns: {header}")
     
     # Verify required columns exist
     # COMET needs source, MT output, and reference translation
     required_columns = ['source', 'mt', 'ref']
-    missing_columns = [col for col in required_columns if col not in df.columns]
+    missing_columns = [col for col in required_columns if col not in header]
     
     if missing_columns:
         raise ValueError(
@@ -101,38 +142,69 @@ def process_excel_file(model, input_file_path, output_file_path):
     
     # Prepare data for COMET prediction
     # COMET expects a list of dictionaries with 'src', 'mt', and 'ref' keys
-    data = []
-    for index, row in df.iterrows():
-        data.append({
-            "src": str(row['source']),  # Source language text
-            "mt": str(row['mt']),        # Machine translation output
-            "ref": str(row['ref'])       # Reference (human) translation
-        })
-    
-    print(f"  - Computing COMET scores...")
-    
-    # Compute COMET scores for all rows
-    # batch_size=8 processes 8 examples at a time (adjust based on available memory)
-    # gpus=1 uses GPU if available, otherwise falls back to CPU
-    model_output = model.predict(data, batch_size=8, gpus=0)
-    
-    # Extract scores from model output
+    src_idx = header.index('source')  # Source language text
+    mt_idx = header.index('mt')       # Machine translation output
+    ref_idx = header.index('ref')     # Reference (human) translation
+    data = [
+        {"src": _cell_text(row, src_idx), "mt": _cell_text(row, mt_idx), "ref": _cell_text(row, ref_idx)}
+        for row in rows
+    ]
+    
+    return header, rows, data
+
+
+def save_excel_file(header, rows, scores, output_file_path):
+    """
+    Append COMET scores to the prepared rows and save them as a new Excel file.
+    
+    Args:
+        header: Header row returned by prepare_excel_file
+        rows: Data rows returned by prepare_excel_file
+        scores: COMET scores for the rows, in the same order
+                (None for rows skipped because source or mt was blank)
+        output_file_path: Path where output Excel file will be saved
+    """
     # COMET scores range from 0 to 1, where 1 indicates perfect translation
-    scores = model_output['scores']
     
-    # Add COMET scores as a new column to the DataFrame
-    # This preserves all original data and adds the evaluation scores
-    df['comet_score'] = scores
+    # Write the original columns plus a new 'comet_score' column
+    # Rows are streamed straight to xlsxwriter (constant memory, no pandas round-trip)
+    width = len(header)
+    write_xlsx(
+        output_file_path,
+        header + ['comet_score'],
+        (list(row) + [None] * (width - len(row)) + [score] for row, score in zip(rows, scores)),
+    )
+    
+    # Display summary statistics (skipped rows are left out)
+    print(f"\nSaved: {output_file_path}")
+    stats = score_stats(scores)  # numpy reductions over the scored rows
+    if stats["skipped"]:
+        print(f"  - Skipped {stats['skipped']} row(s) with empty source or mt (score left blank)")
+    if stats["avg_score"] is not None:
+        print(f"  - Score range: {stats['min_score']:.4f} - {stats['max_score']:.4f}")
+        print(f"  - Average score: {stats['avg_score']:.4f}")
+
+
+def process_excel_file(model, input_file_path, output_file_path):
+    """
+    Process a single Excel file: read data, compute COMET scores, and save results.
     
-    # Save the DataFrame to a new Excel file
-    # index=False prevents saving the row index as a column
-    df.to_excel(output_file_path, index=False)
+    main() scores all files in one go instead; this is the single-file shortcut.
     
-    # Display summary statistics
-    print(f"  - Scores computed successfully!")
-    print(f"  - Score range: {min(scores):.4f} - {max(scores):.4f}")
-    print(f"  - Average score: {sum(scores)/len(scores):.4f}")
-    print(f"  - Output saved to: {output_file_path}")
+    Args:
+        model: Loaded COMET model
+        input_file_path: Path to input Excel file
+        output_file_path: Path where output Excel file will be saved
+    """
+    header, rows, data = prepare_excel_file(input_file_path)
+    
+    # predict_scores() picks the device (GPU when available) and a batch size
+    # that suits it; set COMET_GPUS / COMET_BATCH_SIZE to override either.
+    # With COMET_SCORE_DB set, segments scored in earlier runs are reused.
+    # If the GPU runs out of memory the batch size is halved automatically.
+    scores = predict_scores(model, data, score_cache=open_score_cache(COMET_MODEL_NAME, int8=int8_requested()))
+    
+    save_excel_file(header, rows, scores, output_file_path)
 
 
 def main():
@@ -140,19 +212,24 @@ def main():
     Main function to orchestrate the COMET evaluation process.
     
     This function:
-    1. Loads the COMET model (downloads if needed)
-    2. Processes each Excel file in the list
-    3. Saves results with COMET scores added
+    1. Starts loading the COMET model in the background (downloads if needed)
+    2. Reads every Excel file in the list meanwhile
+    3. Scores the rows of all files in a single model.predict call
+    4. Saves each file's results with COMET scores added
     """
     print("=" * 60)
     print("COMET MT Evaluation")
     print("=" * 60)
     
-    # Load the COMET model once (reused for all files)
-    # This is more efficient than loading it for each file
-    model = load_comet_model()
+    # Load the COMET model once (reused for all files), in the background
+    # so it overlaps with reading the Excel files below (if no file can be
+    # read, the script ends without waiting for the load)
+    model_future = load_in_background(load_comet_model)
     
-    # Process each Excel file
+    # Read each Excel file and collect its rows into one combined list
+    # Each job remembers where its rows start and end in that list
+    jobs = []
+    all_data = []
     for excel_file in EXCEL_FILES:
         # Construct full paths for input and output files
         input_path = INPUT_DIR / excel_file
@@ -168,13 +245,35 @@ def main():
         output_filename = excel_file.replace('.xlsx', '_with_scores.xlsx')
         output_path = OUTPUT_DIR / output_filename
         
-        # Process the file: read, compute scores, save
+        # Read and validate the file
         try:
-            process_excel_file(model, input_path, output_path)
+            header, rows, data = prepare_excel_file(input_path)
         except Exception as e:
             print(f"\nError processing {excel_file}: {str(e)}")
             print("  Please check the file format and try again.")
             continue
+        
+        jobs.append((excel_file, header, rows, output_path, len(all_data), len(all_data) + len(data)))
+        all_data.extend(data)
+    
+    if jobs:
+        # Wait for the model load started above
+        model = model_future.result()
+        
+        # Compute COMET scores for all files at once
+        # One predict call pays the model start-up overhead only once and
+        # keeps batches full across file boundaries
+        # (with COMET_SCORE_DB set, segments scored in earlier runs are reused)
+        print(f"\nComputing COMET scores for {len(all_data)} rows from {len(jobs)} file(s)...")
+        scores = predict_scores(model, all_data, score_cache=open_score_cache(COMET_MODEL_NAME, int8=int8_requested()))
+        
+        # Split the scores back per file and save each result
+        for excel_file, header, rows, output_path, start, end in jobs:
+            try:
+                save_excel_file(header, rows, scores[start:end], output_path)
+            except Exception as e:
+                print(f"\nError saving {excel_file}: {str(e)}")
+                continue
     
     print("\n" + "=" * 60)
     print("Evaluation complete!")
@@ -13,24 +13,49 @@ Notes:
 
 from __future__ import annotations
 
+import atexit
+import hashlib
 import os
 import tempfile
+import threading
 import traceback
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-import pandas as pd
 import streamlit as st
 
+# pandas/numpy (like torch/comet) are imported where they are used, so a
+# cold-started app process renders the page without loading them
+if TYPE_CHECKING:
+    import pandas as pd
+
 # --------- IMPORTANT: choose a smaller model for Streamlit Cloud ----------
 # Try this first on Streamlit Cloud:
 COMET_MODEL_NAME = "Unbabel/wmt20-comet-da"  # smaller, more deployable
 # If you have enough RAM elsewhere, you can switch back:
 # COMET_MODEL_NAME = "Unbabel/wmt22-comet-da"
 
+# In-memory segment scores remembered across evaluations are dropped past this many entries
+SCORE_CACHE_MAX_ENTRIES = 200_000
+
 
 # Import your parser (must NOT load COMET at import time)
-from mqxliff_comet_to_xlsx import parse_mqxliff  # noqa: E402
+from mqxliff_parser import parse_mqxliff  # noqa: E402
+from comet_utils import (  # noqa: E402
+    autotune_batch_size,
+    compile_encoder,
+    compile_requested,
+    configure_torch_threads,
+    load_comet_checkpoint,
+    open_score_cache,
+    pick_gpus,
+    predict_scores,
+    quantize_encoder_int8,
+    score_stats,
+    suggest_batch_size,
+    write_xlsx,
+)
 
 
 # Must be the first Streamlit command
@@ -45,11 +70,43 @@ st.title("📊 COMET XLIFF Evaluator")
 st.caption(f"Model: `{COMET_MODEL_NAME}`")
 
 
-def df_to_xlsx_bytes(df: pd.DataFrame) -> bytes:
-    buf = BytesIO()
-    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name="COMET_Scores")
-    return buf.getvalue()
+def _remove_files(paths: set[str]) -> None:
+    """Delete (and forget) every path in paths, ignoring files already gone."""
+    for path in list(paths):
+        paths.discard(path)
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+@st.cache_resource(show_spinner=False)
+def xlsx_export_paths() -> set[str]:
+    """
+    Process-wide set of XLSX exports still on disk (the script body re-runs,
+    so the set lives in the resource cache). Whatever is left is removed at exit.
+    """
+    paths: set[str] = set()
+    atexit.register(_remove_files, paths)
+    return paths
+
+
+def df_to_xlsx_file(df: pd.DataFrame) -> str:
+    """
+    Write df to a temporary .xlsx file and return its path.
+    The workbook goes straight to disk instead of being held in RAM between
+    reruns; it is tracked in xlsx_export_paths() for removal.
+    """
+    # xlsxwriter (constant_memory) is much faster and lighter than openpyxl
+    if "comet_score" in df.columns:
+        # Scores are float32; widening to float64 as-is would write digits
+        # like 0.01099999994, so round back to float32 precision
+        df = df.assign(comet_score=df["comet_score"].astype("float64").round(7))
+    fd, path = tempfile.mkstemp(suffix=".xlsx", prefix="comet_scores_")
+    os.close(fd)
+    xlsx_export_paths().add(path)
+    write_xlsx(path, list(df.columns), df.itertuples(index=False, name=None), sheet_name="COMET_Scores")
+    return path
 
 
 def _apply_hf_token_from_secrets_or_env() -> None:
@@ -59,21 +116,92 @@ def _apply_hf_token_from_secrets_or_env() -> None:
 
 
 @st.cache_resource(show_spinner=False)
-def get_comet_model_cached(model_name: str):
+def get_comet_model_cached(model_name: str, int8: bool = False):
     """
-    Load COMET model ONCE per app process.
-    Import COMET inside the function so it doesn't load torch at import time.
+    Load COMET model ONCE per app process (per model name / INT8 setting).
+    COMET is imported inside load_comet_checkpoint so torch is not loaded at import time.
+    With int8=True the encoder is dynamically quantized (CPU-only, ~4x smaller weights).
     """
-    from comet import download_model, load_from_checkpoint  # type: ignore
-
+    # Match torch's thread pools to the CPUs we actually get (avoids oversubscription)
+    threads = configure_torch_threads()
+    print(f"MODEL LOAD: using {threads} torch thread(s)")
     print(f"MODEL LOAD: starting download/load for {model_name}")
-    model_path = download_model(model_name)
-    print(f"MODEL LOAD: downloaded to {model_path}")
-    model = load_from_checkpoint(model_path)
-    print("MODEL LOAD: load_from_checkpoint done")
+    model = load_comet_checkpoint(model_name)
+    print("MODEL LOAD: load_comet_checkpoint done")
+    if int8:
+        model = quantize_encoder_int8(model)
+        print("MODEL LOAD: encoder quantized to INT8")
+    if compile_requested():
+        model = compile_encoder(model)
+        print("MODEL LOAD: encoder compiled with torch.compile")
     return model
 
 
+@st.cache_resource(show_spinner=False)
+def get_score_cache(model_name: str, int8: bool, bf16: bool, gpus: int):
+    """
+    Process-wide segment_digest(src, mt, ref) -> score memo, one per model, precision setting and device.
+    Shared by all sessions, so segments seen in any earlier evaluation are not re-scored.
+    Kept in the COMET_SCORE_DB SQLite file when set (survives restarts), else in a dict.
+    """
+    cache = open_score_cache(model_name, int8=int8, bf16=bf16, gpus=gpus)
+    return {} if cache is None else cache
+
+
+def _prefetch_model(model_name: str) -> None:
+    """
+    Background-thread body: load the model variant Evaluate uses with the
+    default settings (INT8 encoder when scoring will run on CPU).
+    """
+    try:
+        get_comet_model_cached(model_name, int8=pick_gpus() == 0)
+        print(f"PREFETCH: {model_name} ready")
+    except Exception:
+        # Evaluate retries the load and shows the error in the page
+        print(f"PREFETCH: loading {model_name} failed")
+        traceback.print_exc()
+
+
+@st.cache_resource(show_spinner=False)
+def prefetch_model(model_name: str) -> threading.Thread:
+    """
+    Start loading the COMET model ONCE per app process, in the background.
+    The page renders meanwhile; Evaluate then finds the model in
+    get_comet_model_cached (or waits for the load already in progress).
+    """
+    print(f"PREFETCH: loading {model_name} in background")
+    thread = threading.Thread(target=_prefetch_model, args=(model_name,), daemon=True)
+    thread.start()
+    return thread
+
+
+def _upload_digest(upload) -> str:
+    """Content hash of an uploaded file, read in 1 MB chunks."""
+    digest = hashlib.blake2b(digest_size=16)
+    upload.seek(0)
+    for chunk in iter(lambda: upload.read(1 << 20), b""):
+        digest.update(chunk)
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def parse_upload_cached(content_hash: str, _upload):
+    """
+    Parse an uploaded XLIFF ONCE per file content.
+    Keyed on content_hash; Streamlit does not hash the underscore-prefixed _upload.
+    """
+    print(f"PARSE: parsing upload {content_hash}")
+    # The upload is already an in-memory buffer; lxml parses it directly,
+    # with no temp file written to disk
+    _upload.seek(0)
+    return parse_mqxliff(_upload)
+
+
+# Model download and load overlap with the user picking a file
+# (set COMET_HF_CACHE to a persistent mount to keep the download across restarts)
+prefetch_model(COMET_MODEL_NAME)
+
 with st.sidebar:
     st.header("🔐 Auth")
     st.write("HF token is required if the model is gated.")
@@ -98,12 +226,49 @@ with st.sidebar:
         st.success("✅ Token set from manual input")
 
     st.header("⚙️ Settings")
+    auto_batch = st.checkbox(
+        "Auto batch size",
+        value=True,
+        help="Probe a few batch sizes (capped by free RAM) on the first Evaluate and use the fastest.",
+    )
     batch_size = st.number_input(
         "Batch size",
         min_value=1,
         max_value=64,
         value=4,  # lower by default to reduce memory spikes
-        help="Lower batch size = less memory usage.",
+        disabled=auto_batch,
+        help="Lower batch size = less memory usage. Used when Auto batch size is off.",
+    )
+    use_gpu = st.checkbox(
+        "Use GPU if available",
+        value=True,
+        help="Score on a CUDA/Apple GPU when one is detected. Turn off for small-VRAM cards to score on CPU.",
+    )
+    int8_encoder = st.checkbox(
+        "INT8 encoder on CPU",
+        value=True,
+        help="When scoring on CPU, quantize the encoder to INT8: ~4x smaller weights and faster, "
+        "with slightly different scores. Not used on GPU.",
+    )
+    bf16_cpu = st.checkbox(
+        "BF16 on CPU",
+        value=False,
+        disabled=int8_encoder,
+        help="Score CPU runs under BF16 autocast: faster on CPUs with BF16 support, slightly different scores. "
+        "Not used with the INT8 encoder.",
+    )
+    dedupe_segments = st.checkbox(
+        "Deduplicate segments",
+        value=True,
+        help="Score identical source/MT/reference segments once and reuse the score.",
+    )
+    full_table_rows = st.slider(
+        "Rows in full results table",
+        min_value=100,
+        max_value=10000,
+        value=1000,
+        step=100,
+        help="Cap on the rows sent to the browser for the full results table. The XLSX always has every row.",
     )
 
 st.header("📁 Upload XLIFF")
@@ -125,65 +290,175 @@ if st.button("🚀 Evaluate", type="primary", use_container_width=True):
         _apply_hf_token_from_secrets_or_env()
         print("STEP 1: HF_TOKEN applied (if present)")
 
-        # Save upload to temp file
-        suffix = Path(uploaded_file.name).suffix
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(uploaded_file.getvalue())
-            tmp_path = Path(tmp.name)
-
-        try:
-            print("STEP 2: parsing mqxliff")
-            with st.spinner("Parsing XLIFF..."):
-                extracted_data, source_lang, target_lang = parse_mqxliff(tmp_path)
-
-            if not extracted_data:
-                st.error("No valid translation units found.")
-                st.stop()
-
-            df = pd.DataFrame(extracted_data)
-            if source_lang:
-                df["source_language"] = source_lang
-            if target_lang:
-                df["target_language"] = target_lang
-
-            # Prepare COMET input
-            data = [{"src": r["source"], "mt": r["mt"], "ref": r["ref"]} for r in extracted_data]
-            print(f"STEP 3: prepared {len(data)} rows for COMET")
-
-            # Load model (cached)
-            print("STEP 4: loading COMET model (cached)")
+        # Device first: it decides whether the INT8 encoder is used. One GPU
+        # at most: multi-GPU predict starts DDP processes, which cannot run
+        # inside the Streamlit script thread
+        use_gpus = min(pick_gpus(), 1) if use_gpu else 0
+        use_int8 = int8_encoder and use_gpus == 0
+
+        # Start loading the model (cached) in the background so it overlaps
+        # with parsing; both spend most of their time outside the GIL
+        print("STEP 2a: loading COMET model in background (cached)")
+        loader = ThreadPoolExecutor(max_workers=1)
+        model_future = loader.submit(get_comet_model_cached, COMET_MODEL_NAME, int8=use_int8)
+        loader.shutdown(wait=False)
+
+        # Parse once per file content; re-clicking Evaluate after changing a
+        # setting reuses the cached rows
+        print("STEP 2b: parsing mqxliff")
+        with st.spinner("Parsing XLIFF..."):
+            content_hash = _upload_digest(uploaded_file)
+            extracted_data, source_lang, target_lang = parse_upload_cached(content_hash, uploaded_file)
+
+        if not extracted_data:
+            st.error("No valid translation units found.")
+            st.stop()
+
+        # Prepare COMET input straight from the parsed rows
+        data = [{"src": r["source"], "mt": r["mt"], "ref": r["ref"]} for r in extracted_data]
+        print(f"STEP 3: prepared {len(data)} rows for COMET")
+
+        # Re-clicking Evaluate on the same file with settings that give the
+        # same scores reuses the previous scores: no model wait, tuning or
+        # scoring (batch size and dedupe do not change scores; the device
+        # does, since GPU runs score in FP16)
+        use_bf16 = bf16_cpu and not use_int8
+        scores_key = (content_hash, COMET_MODEL_NAME, use_int8, use_bf16, use_gpus)
+        if st.session_state.get("scores_key") == scores_key:
+            print("STEP 4-5: reusing scores from the previous evaluation")
+            scores = st.session_state["scores"]
+        else:
+            # Wait for the model load started above
+            print("STEP 4: waiting for COMET model")
             with st.spinner("Loading COMET model (first time can be heavy)..."):
-                model = get_comet_model_cached(COMET_MODEL_NAME)
+                model = model_future.result()
+
+            # Segments scored in earlier evaluations (and by the batch-size
+            # probe below) are not scored again
+            score_cache = get_score_cache(COMET_MODEL_NAME, use_int8, use_bf16, use_gpus)
+            # The cap bounds the in-memory dict only; the COMET_SCORE_DB file is meant to keep everything
+            if isinstance(score_cache, dict) and len(score_cache) > SCORE_CACHE_MAX_ENTRIES:
+                score_cache.clear()
+
+            # Batch size: the sidebar value, or (auto) the fastest of a few probed
+            # sizes capped by free RAM. Tuning runs once per session and settings.
+            effective_batch_size = int(batch_size)
+            if auto_batch:
+                tune_key = (COMET_MODEL_NAME, use_int8, use_bf16, use_gpus)
+                ram_cap = suggest_batch_size(data)
+                candidates = [c for c in (8, 16, 32, 64) if ram_cap is None or c <= ram_cap] or [ram_cap]
+                if st.session_state.get("tuned_bs_key") == tune_key:
+                    effective_batch_size = st.session_state["tuned_bs"]
+                elif len(data) <= max(candidates):
+                    # The whole file fits in one batch: nothing to tune
+                    effective_batch_size = min(len(data), max(candidates))
+                else:
+                    with st.spinner("Tuning batch size..."):
+                        effective_batch_size = autotune_batch_size(
+                            model,
+                            data[: max(candidates)],
+                            candidates,
+                            gpus=use_gpus,
+                            bf16=use_bf16,
+                            score_cache=score_cache,
+                        )
+                    st.session_state["tuned_bs"] = effective_batch_size
+                    st.session_state["tuned_bs_key"] = tune_key
+                st.caption(f"Auto-tuned batch: {effective_batch_size}")
+            print(f"STEP 4b: batch size {effective_batch_size}")
 
             print("STEP 5: scoring")
-            with st.spinner("Scoring..."):
-                # CPU scoring; keep batch size conservative
-                model_out = model.predict(data, batch_size=int(batch_size), gpus=0)
-
-            scores = model_out["scores"]
-            df["comet_score"] = scores
-
-            st.success("✅ Done!")
-            st.write(f"Language pair: {source_lang} → {target_lang}" if source_lang and target_lang else "Language pair: (not found)")
-
-            st.dataframe(df.head(20), use_container_width=True, hide_index=True)
-
-            out_name = f"{Path(uploaded_file.name).stem}_comet_scores.xlsx"
+            # Score in chunks so the progress bar moves (GPU when available,
+            # else CPU; the INT8 encoder only runs on CPU)
+            progress_bar = st.progress(0.0, text="Scoring...")
+            scores = predict_scores(
+                model,
+                data,
+                batch_size=effective_batch_size,
+                gpus=use_gpus,
+                bf16=use_bf16,
+                dedupe=dedupe_segments,
+                chunk_size=512,
+                score_cache=score_cache,
+                progress=lambda done, total: progress_bar.progress(done / total, text=f"Scoring... {done:,}/{total:,}"),
+            )
+            progress_bar.empty()
+            st.session_state["scores"] = scores
+            st.session_state["scores_key"] = scores_key
+
+        # Build the export table only once scores are available
+        import numpy as np
+        import pandas as pd
+
+        df = pd.DataFrame(extracted_data)
+        # Low-cardinality text columns (e.g. mt_provider) are stored as
+        # categories: one small code per row instead of one string object
+        for col in df.columns:
+            if df[col].nunique() * 2 <= len(df):
+                df[col] = df[col].astype("category")
+            else:
+                # The rest (source/mt/ref, ids) go into contiguous Arrow
+                # buffers instead of one Python object per cell (pyarrow
+                # ships with Streamlit)
+                df[col] = df[col].astype("string[pyarrow]")
+        # Language codes are the same on every row: single-category columns
+        codes = np.zeros(len(df), dtype=np.int8)
+        if source_lang:
+            df["source_language"] = pd.Categorical.from_codes(codes, categories=[source_lang])
+        if target_lang:
+            df["target_language"] = pd.Categorical.from_codes(codes, categories=[target_lang])
+        # float32 halves the score column's memory
+        scores_np = np.fromiter(scores, dtype=np.float32, count=len(scores))
+        df["comet_score"] = scores_np
+
+        st.success("✅ Done!")
+        st.write(f"Language pair: {source_lang} → {target_lang}" if source_lang and target_lang else "Language pair: (not found)")
+
+        # Summary metrics (numpy reductions shared with the CLI scripts)
+        stats = score_stats(scores)
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Units", f"{stats['total_units']:,}")
+        for col, label, key in ((c2, "Avg", "avg_score"), (c3, "Min", "min_score"), (c4, "Max", "max_score")):
+            col.metric(label, "n/a" if stats[key] is None else f"{stats[key]:.4f}")
+        if stats["skipped"]:
+            st.caption(f"{stats['skipped']:,} unit(s) with empty source or MT were not scored.")
+
+        # Score distribution, pre-binned so the chart payload is 50 bars
+        # however many rows were scored (wmt20 scores are not bounded to
+        # 0..1, so the bins span the observed range; skipped rows are NaN)
+        finite_scores = scores_np[np.isfinite(scores_np)]
+        if finite_scores.size:
+            counts, edges = np.histogram(finite_scores, bins=50)
+            hist_df = pd.DataFrame({"comet_score": np.round((edges[:-1] + edges[1:]) / 2, 3), "segments": counts})
+            st.bar_chart(hist_df, x="comet_score", y="segments")
+
+        # Only capped slices are sent to the browser: a short preview, and
+        # up to full_table_rows rows behind the expander (the download has all)
+        st.dataframe(df.head(10), use_container_width=True, hide_index=True)
+        with st.expander(f"View full results table ({min(len(df), full_table_rows):,} of {len(df):,} rows)"):
+            st.dataframe(df.head(full_table_rows), use_container_width=True, hide_index=True)
+
+        # Build the XLSX once per (file, scores); re-evaluating with settings
+        # that give the same scores reuses the file from session_state
+        xlsx_sig = f"{content_hash}:{hashlib.blake2b(scores_np.tobytes(), digest_size=8).hexdigest()}"
+        if st.session_state.get("xlsx_sig") != xlsx_sig or not os.path.exists(st.session_state["xlsx_path"]):
+            # Replace (and delete) this session's previous export
+            if "xlsx_path" in st.session_state:
+                _remove_files({st.session_state["xlsx_path"]})
+                xlsx_export_paths().discard(st.session_state["xlsx_path"])
+            st.session_state["xlsx_path"] = df_to_xlsx_file(df)
+            st.session_state["xlsx_sig"] = xlsx_sig
+
+        out_name = f"{Path(uploaded_file.name).stem}_comet_scores.xlsx"
+        with open(st.session_state["xlsx_path"], "rb") as xlsx_file:
             st.download_button(
                 "📥 Download XLSX",
-                data=df_to_xlsx_bytes(df),
+                data=xlsx_file,
                 file_name=out_name,
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                 use_container_width=True,
             )
 
-        finally:
-            try:
-                if tmp_path.exists():
-                    os.unlink(tmp_path)
-            except Exception:
-                pass
-
     except Exception as e:
         st.error("🚨 App crashed with an exception:")
         st.code(traceback.format_exc())